@@ -47,36 +47,148 @@ Then implement with performance considerations addressed.
 ## AI Output
 
 ```python
-from datetime import datetime, timedelta
-from typing import Optional, Dict, List
+from datetime import datetime, timedelta, timezone
+from typing import Any, Coroutine, Deque, Optional, Dict, List, Tuple
+from collections import deque
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
 from enum import Enum
+from functools import lru_cache
 import asyncio
+import math
+import random
+import secrets
+import struct
+import time
 
+import asyncpg
+from cachetools import TTLCache
+import msgpack
+import orjson
 import redis.asyncio as redis
-from sqlalchemy import select, text
-from sqlalchemy.ext.asyncio import AsyncSession
 import structlog
+import uvloop
+import xxhash
+import zstandard as zstd
 
 logger = structlog.get_logger()
 
 # Configuration
 CACHE_TTL_SECONDS = 300  # 5 minutes
 HOT_DATA_HOURS = 24  # Last 24 hours cached
-MAX_CONCURRENT_QUERIES = 100  # Semaphore limit
+DB_POOL_MIN_SIZE = 10  # Warm connections kept open for bursts
+DB_POOL_MAX_SIZE = 50
+# DB permits never exceed connections, so waiting happens (and times out)
+# at the permit queue rather than inside pool.acquire()
+MAX_CONCURRENT_QUERIES = DB_POOL_MAX_SIZE
+PERMIT_ACQUIRE_TIMEOUT_SECONDS = 0.2  # Shed load instead of queueing forever
+METRIC_PERMIT_SHARE = 0.75  # Max fraction of DB permits one metric may hold
+CACHE_FORMAT_VERSION = b"\x05"  # msgpack + zstd flag; bump on format change
+CACHE_COMPRESS_THRESHOLD_BYTES = 1024  # zstd-compress larger payloads
+CACHE_DECODE_BUFFER_BYTES = 64 * 1024  # Streaming decode window (per row)
+CACHE_LOCK_TTL_MS = 10_000  # Cross-worker recompute lock
+CACHE_LOCK_WAIT_SECONDS = 0.15  # Max wait on another worker's recompute
+XFETCH_BETA = 1.0  # >1 favors earlier refresh, <1 later
+CACHE_TTL_JITTER_PCT = 0.2  # TTL spread (+/-10%) to desynchronize expiry
+L0_CACHE_MAXSIZE = 1024  # In-process hot keys
+L0_CACHE_TTL_SECONDS = 30  # Bounds staleness vs Redis
+CACHE_INVALIDATION_CHANNEL = "metric-cache:invalidate"
+FRESHNESS_CACHE_SECONDS = 10  # In-process cache of mv_metadata.last_refresh
+STALENESS_WINDOW = timedelta(minutes=2)  # Older views get a live tail
+LIVE_TAIL_MAX_LAG = timedelta(hours=1)  # Beyond this, serve the stale view
 
-@dataclass
+# Compare-and-delete so a worker never releases a lock it no longer owns
+_RELEASE_LOCK_LUA = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+@dataclass(frozen=True, slots=True)
+class _MetricView:
+    """Whitelisted SQL source for one metric type."""
+    key_id: int  # Baked into cached keys - never renumber
+    view_name: str
+    columns: str  # Columns read from the view (and the live query)
+    total_expr: str  # total_value aggregate over those rows
+    live_sql: str  # Same columns, rolled up from events in [$4, $3)
+
+# Metric type -> SQL source. A closed set: SQL text is never built from
+# caller input, and unknown metric types are rejected when the
+# MetricQuery is built. Distinct counts are HyperLogLog sketches, so
+# totals over several hours union the sketches instead of summing hourly
+# counts.
+_VIEWS = {
+    "active_users": _MetricView(
+        key_id=1,
+        view_name="mv_metrics_active_users",
+        columns="timestamp, tenant_id, users_hll, value",
+        total_expr="hll_cardinality(hll_union_agg(users_hll))",
+        live_sql="""
+            SELECT
+                date_trunc('hour', timestamp),
+                tenant_id,
+                hll_add_agg(hll_hash_text(user_id::text)),
+                hll_cardinality(hll_add_agg(hll_hash_text(user_id::text)))
+            FROM events
+            WHERE event_type = 'page_view'
+                AND timestamp >= $4 AND timestamp < $3
+            GROUP BY 1, 2
+        """,
+    ),
+    "page_views": _MetricView(
+        key_id=2,
+        view_name="mv_metrics_page_views",
+        columns="timestamp, tenant_id, value",
+        total_expr="SUM(value)",
+        live_sql="""
+            SELECT date_trunc('hour', timestamp), tenant_id, COUNT(*)
+            FROM events
+            WHERE event_type = 'page_view'
+                AND timestamp >= $4 AND timestamp < $3
+            GROUP BY 1, 2
+        """,
+    ),
+}
+_GRANULARITY_IDS = {"hour": 1, "day": 2, "week": 3}
+_EPOCH = datetime(1970, 1, 1)
+_NO_FILTERS_DIGEST = bytes(16)
+
+# Reusable (dictionary-free) zstd contexts
+_ZSTD_C = zstd.ZstdCompressor(level=3)
+_ZSTD_D = zstd.ZstdDecompressor()
+
+@dataclass(frozen=True, slots=True)
 class MetricQuery:
-    """Query parameters for analytics metrics."""
+    """Query parameters for analytics metrics.
+    
+    Frozen (hashable) so cache keys can be memoized per query. Filters
+    may be passed as a dict; they are stored as sorted (field, value)
+    pairs. Raises ValueError for unknown metric types or granularities.
+    """
     metric_type: str  # e.g., 'active_users', 'page_views'
     start_date: datetime
     end_date: datetime
     granularity: str  # 'hour', 'day', 'week'
-    filters: Optional[Dict] = None
+    filters: Optional[Tuple[Tuple[str, Any], ...]] = None
+    
+    def __post_init__(self):
+        if self.metric_type not in _VIEWS:
+            raise ValueError(f"unknown metric_type: {self.metric_type!r}")
+        if self.granularity not in _GRANULARITY_IDS:
+            raise ValueError(f"unknown granularity: {self.granularity!r}")
+        if isinstance(self.filters, dict):
+            object.__setattr__(
+                self, "filters", tuple(sorted(self.filters.items()))
+            )
 
-@dataclass
+@dataclass(slots=True)
 class MetricResult:
-    """Result of analytics query with metadata."""
+    """Result of analytics query with metadata.
+    
+    Slotted: no per-instance __dict__, one result per request at 5000 qps.
+    """
     data: List[Dict]
     cached: bool
     query_time_ms: float
@@ -88,6 +200,164 @@ class CacheStrategy(Enum):
     WARM = "warm"    # 1-7 days - cache on first access
     COLD = "cold"    # 7-30 days - direct DB query
 
+class ServiceOverloadedError(Exception):
+    """No DB permit became free in time; callers should return 503."""
+
+@lru_cache(maxsize=4096)
+def _build_cache_key(query: MetricQuery) -> bytes:
+    """Build binary cache key from query parameters.
+    
+    Format (35 bytes): b"m" + struct '<BBqq16s' of
+    (metric id, granularity id, start us, end us, filter digest)
+    
+    Roughly a third the size of the equivalent text key, which adds up
+    across millions of Redis entries. Filters are hashed with xxh3_128 to
+    keep key length constant. Memoized, so repeated queries (e.g. a
+    dashboard batch with shared filters) skip the packing entirely.
+    """
+    filter_digest = _NO_FILTERS_DIGEST
+    if query.filters:
+        filter_digest = xxhash.xxh3_128(repr(query.filters).encode()).digest()
+    
+    return b"m" + struct.pack(
+        "<BBqq16s",
+        _VIEWS[query.metric_type].key_id,
+        _GRANULARITY_IDS[query.granularity],
+        (query.start_date - _EPOCH) // timedelta(microseconds=1),
+        (query.end_date - _EPOCH) // timedelta(microseconds=1),
+        filter_digest
+    )
+
+@lru_cache(maxsize=256)
+def _build_metric_sql(
+    metric_type: str,
+    filter_fields: Tuple[str, ...],
+    live_tail: bool = False
+) -> str:
+    """Build the aggregation SQL for one (metric, filter fields) combination.
+    
+    Memoized so every call for the same combination sends identical SQL
+    text, which lets asyncpg's per-connection statement cache reuse the
+    server-side prepared statement (no re-parse, no re-plan). Granularity,
+    dates and filter values are always bind parameters ($1..$n).
+    
+    With live_tail, rows after the view's last refresh ($4) are rolled up
+    from the base events table and unioned with the view's older rows
+    (Presto's USE_VIEW_QUERY stale-read behavior).
+    """
+    view = _VIEWS[metric_type]
+    filter_clause = " ".join(
+        f"AND {field} = ${i}"
+        for i, field in enumerate(filter_fields, start=5 if live_tail else 4)
+    )
+    
+    if live_tail:
+        source = f"""(
+            SELECT {view.columns} FROM {view.view_name}
+            WHERE timestamp >= $2 AND timestamp < $4
+            UNION ALL
+            {view.live_sql}
+        ) src"""
+        range_clause = "TRUE"
+    else:
+        source = view.view_name
+        range_clause = "timestamp >= $2 AND timestamp < $3"
+    
+    # Build query with proper indexing; one row holding the whole result
+    return f"""
+        SELECT COALESCE(json_agg(t ORDER BY t.period), '[]')
+        FROM (
+            SELECT 
+                date_trunc($1, timestamp) as period,
+                ({view.total_expr})::float8 as total_value,
+                COUNT(*) as count,
+                AVG(value)::float8 as avg_value
+            FROM {source}
+            WHERE 
+                {range_clause}
+                {filter_clause}
+            GROUP BY period
+        ) t
+    """
+
+class _PermitPool:
+    """Counting semaphore with strict FIFO hand-off and timed acquire.
+    
+    A released permit goes straight to the oldest waiter, so a caller
+    arriving just as a permit is returned can't take it ahead of callers
+    already queued.
+    """
+    __slots__ = ("available", "_waiters")
+    
+    def __init__(self, size: int):
+        self.available = size
+        self._waiters: Deque[asyncio.Future] = deque()
+    
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+    
+    async def acquire(self, timeout: float) -> bool:
+        """Take a permit; False if none was handed over within timeout."""
+        if self.available and not self._waiters:
+            self.available -= 1
+            return True
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            # wait() never cancels fut, so a hand-off racing the timeout
+            # is seen below instead of being lost
+            await asyncio.wait((fut,), timeout=max(timeout, 0))
+        except BaseException:
+            self._abandon(fut)
+            raise
+        if fut.done():
+            return True
+        self._abandon(fut)
+        return False
+    
+    def release(self):
+        """Hand the permit to the oldest waiter, or return it to the pool."""
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.available += 1
+    
+    def _abandon(self, fut: asyncio.Future):
+        if fut.done():
+            # Permit was handed over as we gave up - pass it on
+            self.release()
+        else:
+            fut.cancel()
+            self._waiters.remove(fut)
+
+async def _init_db_connection(conn: asyncpg.Connection):
+    """Decode json columns to Python objects in the driver (orjson)."""
+    await conn.set_type_codec(
+        "json",
+        encoder=lambda value: orjson.dumps(value).decode(),
+        decoder=orjson.loads,
+        schema="pg_catalog"
+    )
+
+async def create_db_pool(dsn: str) -> asyncpg.Pool:
+    """Create the asyncpg pool for AnalyticsService.
+    
+    Keeps DB_POOL_MIN_SIZE connections open so traffic bursts don't pay
+    TCP + TLS + auth handshakes, and caches prepared statements per
+    connection so repeated metric queries skip a parse round trip.
+    """
+    return await asyncpg.create_pool(
+        dsn,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=300,
+        statement_cache_size=1024,
+        init=_init_db_connection
+    )
+
 # Performance-optimized analytics service
 class AnalyticsService:
     """
@@ -102,67 +372,130 @@ class AnalyticsService:
     Architecture:
     - Redis cluster for hot data (24h)
     - Postgres materialized views for cold data
-    - Connection pooling (50 DB, 100 Redis)
-    - Semaphore-based concurrency control
+    - Connection pooling (10-50 DB via create_db_pool, 100 Redis)
+    - Permit pools for DB concurrency control (global + per metric,
+      with load shedding)
+    
+    The Redis client must be created with decode_responses=False since
+    cached payloads are binary msgpack.
     """
     
     def __init__(
         self,
-        db_pool: AsyncSession,
+        db_pool: asyncpg.Pool,
         redis_pool: redis.Redis,
         max_concurrent: int = MAX_CONCURRENT_QUERIES
     ):
-        self.db = db_pool
+        self.pool = db_pool
         self.redis = redis_pool
-        self._query_semaphore = asyncio.Semaphore(max_concurrent)
+        # Permit pools: FIFO hand-off, visible depth, timed acquire.
+        # Each metric type is capped at a share of the global pool so one
+        # slow view can't starve the others. Shares add up to more than
+        # the global pool, so an idle metric's capacity is usable by the
+        # busy one; the global pool bounds total DB load and never exceeds
+        # the connection pool.
+        max_concurrent = min(max_concurrent, db_pool.get_max_size())
+        self._permits = _PermitPool(max_concurrent)
+        metric_share = max(
+            1, math.ceil(max_concurrent * METRIC_PERMIT_SHARE)
+        )
+        self._metric_permits: Dict[str, _PermitPool] = {
+            metric_type: _PermitPool(metric_share) for metric_type in _VIEWS
+        }
+        # In-flight recomputes by cache key (single-flight per process)
+        self._inflight: Dict[bytes, asyncio.Task] = {}
+        # L0: per-process cache in front of Redis for ultra-hot keys
+        self._l0: TTLCache = TTLCache(
+            maxsize=L0_CACHE_MAXSIZE, ttl=L0_CACHE_TTL_SECONDS
+        )
+        # mv_metadata.last_refresh per view, cached to skip a query per
+        # miss: view_name -> (last_refresh, cached_until in monotonic time)
+        self._freshness: Dict[str, Tuple[Optional[datetime], float]] = {}
         
     async def get_metric(self, query: MetricQuery) -> MetricResult:
         """
         Get analytics metric with multi-tier caching.
         
         Performance strategy:
-        1. Check Redis cache (hot data)
+        1. Check in-process L0, then Redis cache (hot data)
         2. If miss, check cache strategy
-        3. Query materialized view if needed
+        3. Query materialized view if needed (single-flight per key)
         4. Cache result based on strategy
         
         Time complexity: O(1) cached, O(log n) uncached
         Space complexity: O(k) where k = result size
         """
-        start_time = datetime.utcnow()
+        start_ns = time.perf_counter_ns()  # Monotonic, no datetime allocs
         
         # Determine cache strategy based on data age
         strategy = self._get_cache_strategy(query.start_date)
-        cache_key = self._build_cache_key(query)
+        cache_key = _build_cache_key(query)
         
         # Try cache first for hot/warm data
         if strategy in (CacheStrategy.HOT, CacheStrategy.WARM):
-            cached_data = await self._get_from_cache(cache_key)
-            if cached_data:
-                query_time = (datetime.utcnow() - start_time).total_seconds() * 1000
-                logger.info(
-                    "cache_hit",
-                    metric=query.metric_type,
-                    strategy=strategy.value,
-                    query_time_ms=query_time
-                )
-                return MetricResult(
-                    data=cached_data,
-                    cached=True,
-                    query_time_ms=query_time
-                )
-        
-        # Cache miss or cold data - query database with concurrency control
-        async with self._query_semaphore:
-            data = await self._query_database(query)
+            cached = self._l0.get(cache_key)
+            if cached is None:
+                cached = await self._get_from_cache(cache_key)
+                if cached is not None:
+                    self._l0[cache_key] = cached
+            if cached is not None:
+                return self._cache_hit(query, strategy, cached, start_ns)
         
-        # Cache hot/warm data
+        return await self._get_uncached(query, cache_key, strategy, start_ns)
+    
+    def _cache_hit(
+        self,
+        query: MetricQuery,
+        strategy: CacheStrategy,
+        cached: Tuple[List[Dict], Optional[datetime]],
+        start_ns: int
+    ) -> MetricResult:
+        """Build (and log) the result for a cache hit."""
+        data, data_freshness = cached
+        query_time = (time.perf_counter_ns() - start_ns) / 1e6
+        logger.info(
+            "cache_hit",
+            metric=query.metric_type,
+            strategy=strategy.value,
+            query_time_ms=query_time
+        )
+        return MetricResult(
+            data=data,
+            cached=True,
+            query_time_ms=query_time,
+            data_freshness=data_freshness
+        )
+    
+    async def _get_uncached(
+        self,
+        query: MetricQuery,
+        cache_key: bytes,
+        strategy: CacheStrategy,
+        start_ns: int
+    ) -> MetricResult:
+        """Resolve a cache miss (or cold query) from the database."""
+        # Cache miss or cold data - concurrent misses on the same key
+        # share one database query instead of stampeding
         if strategy == CacheStrategy.HOT:
-            await self._set_cache(cache_key, data, ttl=CACHE_TTL_SECONDS)
+            ttl = CACHE_TTL_SECONDS
         elif strategy == CacheStrategy.WARM:
-            await self._set_cache(cache_key, data, ttl=CACHE_TTL_SECONDS * 2)
+            ttl = CACHE_TTL_SECONDS * 2
+        else:
+            ttl = None
         
-        query_time = (datetime.utcnow() - start_time).total_seconds() * 1000
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(
+                self._load_and_cache(query, cache_key, ttl)
+            )
+            self._inflight[cache_key] = task
+            task.add_done_callback(
+                lambda _: self._inflight.pop(cache_key, None)
+            )
+        # Shield so one cancelled caller doesn't cancel the shared query
+        data, data_freshness = await asyncio.shield(task)
+        
+        query_time = (time.perf_counter_ns() - start_ns) / 1e6
         logger.info(
             "cache_miss",
             metric=query.metric_type,
@@ -174,9 +507,164 @@ class AnalyticsService:
             data=data,
             cached=False,
             query_time_ms=query_time,
-            data_freshness=await self._get_materialized_view_freshness()
+            data_freshness=data_freshness
         )
     
+    async def _load_and_cache(
+        self,
+        query: MetricQuery,
+        cache_key: bytes,
+        ttl: Optional[int]
+    ) -> Tuple[List[Dict], Optional[datetime]]:
+        """Query the database and populate the cache.
+        
+        Returns the rows with the data freshness they actually reflect,
+        whether computed here or read back from another worker's write.
+        
+        Across workers, a Redis SET NX PX lock elects one recompute per
+        key; losers poll the cache with exponential backoff, take over the
+        lock if the winner releases it without writing, and only fall back
+        to querying without the lock after CACHE_LOCK_WAIT_SECONDS.
+        """
+        if ttl is None:
+            async with self._db_permit(query.metric_type):
+                return await self._query_database(query)
+        
+        lock_key = b"lock:" + cache_key
+        token = secrets.token_hex(8)
+        locked = False
+        try:
+            locked = bool(await self.redis.set(
+                lock_key, token, nx=True, px=CACHE_LOCK_TTL_MS
+            ))
+            if not locked:
+                cached, locked = await self._wait_for_cache(
+                    cache_key, lock_key, token
+                )
+                if cached is not None:
+                    return cached
+        except Exception as e:
+            # Redis unavailable - query without the lock
+            logger.warning("cache_lock_error", error=str(e))
+        
+        try:
+            started_ns = time.perf_counter_ns()
+            async with self._db_permit(query.metric_type):
+                data, data_freshness = await self._query_database(query)
+            await self._set_cache(
+                cache_key, data, data_freshness, ttl,
+                delta=(time.perf_counter_ns() - started_ns) / 1e9
+            )
+            return data, data_freshness
+        finally:
+            if locked:
+                try:
+                    await self.redis.eval(_RELEASE_LOCK_LUA, 1, lock_key, token)
+                except Exception as e:
+                    logger.warning("cache_unlock_error", error=str(e))
+    
+    @property
+    def available_db_permits(self) -> int:
+        """Free DB permits; export as a backpressure/autoscaling signal."""
+        return self._permits.available
+    
+    @property
+    def db_permit_waiters(self) -> int:
+        """Callers queued for a global DB permit (queue depth)."""
+        return self._permits.waiting
+    
+    @property
+    def available_metric_permits(self) -> Dict[str, int]:
+        """Free DB permits per metric type (spot a saturated view)."""
+        return {
+            metric_type: permits.available
+            for metric_type, permits in self._metric_permits.items()
+        }
+    
+    @asynccontextmanager
+    async def _db_permit(self, metric_type: str):
+        """Hold one DB permit for the duration of the block.
+        
+        Takes the metric type's permit first, then a global one, so
+        callers queued behind a slow metric never hold global permits.
+        Permits are granted strictly in arrival order. Raises
+        ServiceOverloadedError if both aren't acquired within
+        PERMIT_ACQUIRE_TIMEOUT_SECONDS.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + PERMIT_ACQUIRE_TIMEOUT_SECONDS
+        metric_permits = self._metric_permits[metric_type]
+        
+        await self._take_permit(metric_permits, deadline, metric_type)
+        try:
+            await self._take_permit(self._permits, deadline, metric_type)
+            try:
+                yield
+            finally:
+                self._permits.release()
+        finally:
+            metric_permits.release()
+    
+    @asynccontextmanager
+    async def _connection(self):
+        """Acquire a pooled connection, shedding load instead of queueing.
+        
+        Every caller already holds a DB permit, and permits never exceed
+        the pool size, so this should not wait; the timeout is a backstop
+        if the pool shrinks or something else holds connections.
+        """
+        try:
+            conn = await self.pool.acquire(
+                timeout=PERMIT_ACQUIRE_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            logger.warning("db_pool_timeout")
+            raise ServiceOverloadedError("database connection pool exhausted")
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+    
+    async def _take_permit(
+        self,
+        permits: _PermitPool,
+        deadline: float,
+        metric_type: str
+    ):
+        """Get a permit from the pool before the loop-time deadline."""
+        timeout = deadline - asyncio.get_running_loop().time()
+        if not await permits.acquire(timeout):
+            logger.warning("db_permit_timeout", metric=metric_type)
+            raise ServiceOverloadedError("database concurrency limit reached")
+    
+    async def _wait_for_cache(
+        self,
+        key: bytes,
+        lock_key: bytes,
+        token: str
+    ) -> Tuple[Optional[Tuple[List[Dict], Optional[datetime]]], bool]:
+        """Poll the cache while another worker holds the recompute lock.
+        
+        Returns (cached, locked). Backs off exponentially (10ms doubling,
+        capped at 50ms) for at most CACHE_LOCK_WAIT_SECONDS. After each
+        miss the lock is retried, so if the winner failed (query error,
+        overload, cache write error) one waiter takes over the recompute
+        instead of every waiter sleeping out the lock TTL.
+        """
+        delay = 0.01
+        deadline = time.monotonic() + CACHE_LOCK_WAIT_SECONDS
+        while (remaining := deadline - time.monotonic()) > 0:
+            await asyncio.sleep(min(delay, remaining))
+            cached = await self._get_from_cache(key, allow_early_refresh=False)
+            if cached is not None:
+                return cached, False
+            if await self.redis.set(
+                lock_key, token, nx=True, px=CACHE_LOCK_TTL_MS
+            ):
+                return None, True
+            delay = min(delay * 2, 0.05)
+        return None, False
+    
     def _get_cache_strategy(self, start_date: datetime) -> CacheStrategy:
         """Determine cache strategy based on data age.
         
@@ -193,145 +681,296 @@ class AnalyticsService:
         else:
             return CacheStrategy.COLD
     
-    def _build_cache_key(self, query: MetricQuery) -> str:
-        """Build cache key from query parameters.
+    async def _get_from_cache(
+        self,
+        key: bytes,
+        allow_early_refresh: bool = True
+    ) -> Optional[Tuple[List[Dict], Optional[datetime]]]:
+        """Get (rows, data freshness) from Redis cache.
         
-        Format: metric:{type}:{start}:{end}:{granularity}:{filter_hash}
+        Time complexity: O(1)
+        Network: Single round trip
+        Payloads from an unknown format version are treated as a miss
         
-        Uses hash for filters to keep key length constant.
+        Probabilistic early expiration (XFetch): a hit is occasionally
+        reported as a miss shortly before expiry, weighted by how long the
+        value took to compute, so one caller refreshes it before every
+        caller misses at once.
         """
-        import hashlib
-        import json
-        
-        filter_hash = ""
-        if query.filters:
-            filter_str = json.dumps(query.filters, sort_keys=True)
-            filter_hash = hashlib.md5(filter_str.encode()).hexdigest()[:8]
-        
-        return (
-            f"metric:{query.metric_type}:"
-            f"{query.start_date.isoformat()}:"
-            f"{query.end_date.isoformat()}:"
-            f"{query.granularity}:"
-            f"{filter_hash}"
-        )
+        try:
+            return self._decode_cache_value(
+                await self.redis.get(key), allow_early_refresh
+            )
+        except Exception as e:
+            logger.warning("cache_read_error", error=str(e))
+        return None
     
-    async def _get_from_cache(self, key: str) -> Optional[List[Dict]]:
-        """Get data from Redis cache.
+    async def _get_many_from_cache(
+        self,
+        keys: List[bytes]
+    ) -> List[Optional[Tuple[List[Dict], Optional[datetime]]]]:
+        """Get several keys from Redis cache in one MGET.
         
-        Time complexity: O(1)
-        Network: Single round trip
+        Network: Single round trip regardless of len(keys)
+        A value that fails to decode is a miss for that key only.
         """
+        if not keys:
+            return []
         try:
-            import json
-            data = await self.redis.get(key)
-            if data:
-                return json.loads(data)
+            raw_values = await self.redis.mget(keys)
         except Exception as e:
             logger.warning("cache_read_error", error=str(e))
-        return None
+            return [None] * len(keys)
+        
+        values = []
+        for raw in raw_values:
+            try:
+                values.append(self._decode_cache_value(raw))
+            except Exception as e:
+                logger.warning("cache_read_error", error=str(e))
+                values.append(None)
+        return values
     
-    async def _set_cache(self, key: str, data: List[Dict], ttl: int):
+    def _decode_cache_value(
+        self,
+        data: Optional[bytes],
+        allow_early_refresh: bool = True
+    ) -> Optional[Tuple[List[Dict], Optional[datetime]]]:
+        """Decode a raw cache payload, applying the XFetch check.
+        
+        Compressed payloads are decompressed as a stream straight into the
+        msgpack unpacker, so peak memory is one decode window rather than
+        a second full copy of the payload. The XFetch check runs before
+        the rows are decoded at all.
+        """
+        if not data or data[:1] != CACHE_FORMAT_VERSION:
+            return None
+        body = memoryview(data)[2:]  # No copy of the payload
+        if data[1:2] == b"\x01":
+            unpacker = msgpack.Unpacker(
+                _ZSTD_D.stream_reader(body),
+                raw=False,
+                max_buffer_size=CACHE_DECODE_BUFFER_BYTES
+            )
+        else:
+            unpacker = msgpack.Unpacker(raw=False)
+            unpacker.feed(body)
+        
+        unpacker.read_array_header()  # [delta, expiry, freshness, rows]
+        delta = unpacker.unpack()
+        expiry = unpacker.unpack()
+        if allow_early_refresh and (
+            time.time() - delta * XFETCH_BETA * math.log(random.random())
+            >= expiry
+        ):
+            return None
+        freshness_seconds = unpacker.unpack()
+        data_freshness = (
+            None if freshness_seconds is None
+            else _EPOCH + timedelta(seconds=freshness_seconds)
+        )
+        rows = [unpacker.unpack() for _ in range(unpacker.read_array_header())]
+        return rows, data_freshness
+    
+    async def _set_cache(
+        self,
+        key: bytes,
+        data: List[Dict],
+        data_freshness: Optional[datetime],
+        ttl: int,
+        delta: float = 0.0
+    ):
         """Set data in Redis cache with TTL.
         
         Time complexity: O(1)
         Network: Single round trip
-        Handles cache stampede with NX flag
+        
+        TTL is jittered by +/-10% so keys written together (e.g. one
+        dashboard load) don't all expire, and get recomputed, together.
+        
+        Stored alongside the recompute time (delta, seconds) and absolute
+        expiry used for probabilistic early expiration, and the data
+        freshness the rows reflect (naive UTC, as epoch seconds; nil if
+        unknown).
+        
+        Serialized as msgpack (smaller and cheaper to decode than JSON),
+        prefixed with a one-byte format version and a one-byte compression
+        flag. Payloads over 1KB are zstd-compressed to save Redis memory
+        and network bytes on large warm-tier results.
         """
+        ttl = int(
+            ttl - ttl * CACHE_TTL_JITTER_PCT / 2
+            + ttl * CACHE_TTL_JITTER_PCT * random.random()
+        )
         try:
-            import json
-            await self.redis.setex(
-                key,
-                ttl,
-                json.dumps(data)
+            buf = msgpack.packb(
+                [
+                    delta,
+                    time.time() + ttl,
+                    None if data_freshness is None
+                    else (data_freshness - _EPOCH).total_seconds(),
+                    data
+                ],
+                use_bin_type=True
             )
+            if len(buf) > CACHE_COMPRESS_THRESHOLD_BYTES:
+                buf = b"\x01" + _ZSTD_C.compress(buf)
+            else:
+                buf = b"\x00" + buf
+            await self.redis.setex(key, ttl, CACHE_FORMAT_VERSION + buf)
+            # Drop stale L0 copies on every worker (including this one)
+            await self.redis.publish(CACHE_INVALIDATION_CHANNEL, key)
         except Exception as e:
             # Log but don't fail - cache is optimization
             logger.warning("cache_write_error", error=str(e))
     
-    async def _query_database(self, query: MetricQuery) -> List[Dict]:
+    async def listen_for_invalidations(self):
+        """Evict L0 entries as other workers rewrite them in Redis.
+        
+        Run once per process as a background task; L0's short TTL still
+        bounds staleness if the subscription drops.
+        """
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    self._l0.pop(message["data"], None)
+        finally:
+            await pubsub.unsubscribe(CACHE_INVALIDATION_CHANNEL)
+            await pubsub.close()
+    
+    async def _query_database(
+        self,
+        query: MetricQuery
+    ) -> Tuple[List[Dict], Optional[datetime]]:
         """Query materialized view for aggregated metrics.
         
+        Returns the rows and the data freshness they reflect: the view's
+        last refresh, now if a live tail was read, or None if the view's
+        refresh time is unknown.
+        
         Performance considerations:
         - Uses pre-aggregated materialized views (O(log n) vs O(n))
         - Indexed on date for fast range queries
         - Connection pooling prevents connection exhaustion
-        - Semaphore prevents overwhelming database
+        - Permit pool prevents overwhelming database
         
         Time complexity: O(log n + k) where:
         - log n: index seek time
         - k: number of results returned
         
         Space complexity: O(k) for result set
+        
+        Hot read path: runs directly on a pooled asyncpg connection. Postgres
+        aggregates the rows into a single JSON array (json_agg), which the
+        pool's json codec decodes in one parse instead of per-row
+        conversion.
+        
+        If the view is staler than STALENESS_WINDOW (but within
+        LIVE_TAIL_MAX_LAG) and the query reaches past its last refresh,
+        that tail is read from the events table instead of serving stale
+        data.
         """
-        # Map metric type to materialized view
-        view_name = f"mv_metrics_{query.metric_type}"
+        filter_fields, filter_values = self._build_filter_params(query.filters)
+        params = [query.granularity, query.start_date, query.end_date]
         
-        # Build query with proper indexing
-        sql = text(f"""
-            SELECT 
-                date_trunc(:granularity, timestamp) as period,
-                SUM(value) as total_value,
-                COUNT(*) as count,
-                AVG(value) as avg_value
-            FROM {view_name}
-            WHERE 
-                timestamp >= :start_date
-                AND timestamp < :end_date
-                {self._build_filter_clause(query.filters)}
-            GROUP BY period
-            ORDER BY period
-        """)
-        
-        result = await self.db.execute(
-            sql,
-            {
-                "granularity": query.granularity,
-                "start_date": query.start_date,
-                "end_date": query.end_date,
-                **(query.filters or {})
-            }
+        # Metric type maps to a whitelisted materialized view
+        view_name = _VIEWS[query.metric_type].view_name
+        last_refresh = await self._get_materialized_view_freshness(view_name)
+        live_tail = last_refresh is not None and self._needs_live_tail(
+            query, view_name, last_refresh
         )
+        if live_tail:
+            params.append(max(last_refresh, query.start_date))
+        
+        sql = _build_metric_sql(query.metric_type, filter_fields, live_tail)
         
-        # Convert to list of dicts
-        return [
-            {
-                "period": row.period.isoformat(),
-                "total_value": float(row.total_value),
-                "count": int(row.count),
-                "avg_value": float(row.avg_value)
-            }
-            for row in result
-        ]
+        async with self._connection() as conn:
+            # period arrives as an ISO-8601 string from Postgres
+            data = await conn.fetchval(sql, *params, *filter_values)
+        return data, datetime.utcnow() if live_tail else last_refresh
     
-    def _build_filter_clause(self, filters: Optional[Dict]) -> str:
-        """Build SQL filter clause from filter dict.
+    def _needs_live_tail(
+        self,
+        query: MetricQuery,
+        view_name: str,
+        last_refresh: datetime
+    ) -> bool:
+        """Whether to read the query's recent end from the events table.
+        
+        Only for a bounded lag: if the refresh job has stalled beyond
+        LIVE_TAIL_MAX_LAG, the tail would be a large scan of events, so
+        the stale view is served (with its real freshness) instead.
+        """
+        if query.end_date <= last_refresh:
+            return False
+        lag = datetime.utcnow() - last_refresh
+        if lag > LIVE_TAIL_MAX_LAG:
+            logger.warning(
+                "materialized_view_lagging",
+                view=view_name,
+                lag_seconds=lag.total_seconds()
+            )
+            return False
+        return lag > STALENESS_WINDOW
+    
+    def _build_filter_params(
+        self,
+        filters: Optional[Tuple[Tuple[str, Any], ...]]
+    ) -> Tuple[Tuple[str, ...], List[Any]]:
+        """Split (field, value) filter pairs into fields and bind values.
+        
+        Fields keep the sorted order from MetricQuery, so the same filter
+        set always maps to the same prepared statement.
         
         Security: Uses parameterized queries, safe from SQL injection.
         """
         if not filters:
-            return ""
+            return (), []
         
         # Whitelist allowed filter fields
         allowed_fields = {"user_id", "tenant_id", "event_type"}
-        clauses = []
+        fields = []
+        values = []
         
-        for field, value in filters.items():
+        for field, value in filters:
             if field in allowed_fields:
-                clauses.append(f"AND {field} = :{field}")
+                fields.append(field)
+                values.append(value)
         
-        return " ".join(clauses)
+        return tuple(fields), values
     
-    async def _get_materialized_view_freshness(self) -> datetime:
-        """Get timestamp of last materialized view refresh.
+    async def _get_materialized_view_freshness(
+        self,
+        view_name: str
+    ) -> Optional[datetime]:
+        """Get timestamp of a materialized view's last refresh (naive UTC).
         
-        Used to inform users about data staleness.
+        Used to inform users about data staleness and to decide when to
+        read a live tail. Cached in-process per view for
+        FRESHNESS_CACHE_SECONDS, so cache misses don't each pay an extra
+        round trip. None if the view has no mv_metadata row: freshness is
+        unknown, so it is reported as such rather than as "now".
         """
-        result = await self.db.execute(
-            text("SELECT last_refresh FROM mv_metadata WHERE view_name = 'metrics'")
+        cached = self._freshness.get(view_name)
+        if cached is not None and time.monotonic() < cached[1]:
+            return cached[0]
+        
+        async with self._connection() as conn:
+            last_refresh = await conn.fetchval(
+                "SELECT last_refresh FROM mv_metadata WHERE view_name = $1",
+                view_name
+            )
+        if last_refresh is not None and last_refresh.tzinfo is not None:
+            # timestamptz arrives tz-aware; the service uses naive UTC
+            last_refresh = last_refresh.astimezone(timezone.utc).replace(
+                tzinfo=None
+            )
+        self._freshness[view_name] = (
+            last_refresh, time.monotonic() + FRESHNESS_CACHE_SECONDS
         )
-        row = result.first()
-        return row.last_refresh if row else datetime.utcnow()
+        return last_refresh
     
     async def batch_get_metrics(
         self,
@@ -340,15 +979,51 @@ class AnalyticsService:
         """Get multiple metrics concurrently for dashboard loading.
         
         Performance optimization:
-        - Executes queries in parallel (up to semaphore limit)
+        - One MGET for every hot/warm query (single Redis round trip)
+        - Executes misses in parallel (up to DB permit limit)
         - Returns all results together (reduces round trips)
         - Handles partial failures gracefully
         
         Time complexity: O(1) for cached, O(log n) for uncached
-        Network: Parallel execution, not sequential
+        Network: One cache round trip, then parallel DB queries for misses
         """
-        tasks = [self.get_metric(query) for query in queries]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        start_ns = time.perf_counter_ns()
+        strategies = [self._get_cache_strategy(q.start_date) for q in queries]
+        keys = [_build_cache_key(q) for q in queries]
+        
+        results: List = [None] * len(queries)
+        cacheable = []
+        for i, strategy in enumerate(strategies):
+            if strategy not in (CacheStrategy.HOT, CacheStrategy.WARM):
+                continue
+            cached = self._l0.get(keys[i])
+            if cached is not None:
+                results[i] = self._cache_hit(
+                    queries[i], strategy, cached, start_ns
+                )
+            else:
+                cacheable.append(i)
+        
+        from_redis = await self._get_many_from_cache(
+            [keys[i] for i in cacheable]
+        )
+        for i, cached in zip(cacheable, from_redis):
+            if cached is not None:
+                self._l0[keys[i]] = cached
+                results[i] = self._cache_hit(
+                    queries[i], strategies[i], cached, start_ns
+                )
+        
+        misses = [i for i, result in enumerate(results) if result is None]
+        fetched = await asyncio.gather(
+            *(
+                self._get_uncached(queries[i], keys[i], strategies[i], start_ns)
+                for i in misses
+            ),
+            return_exceptions=True
+        )
+        for i, result in zip(misses, fetched):
+            results[i] = result
         
         # Handle exceptions gracefully
         processed_results = []
@@ -368,33 +1043,127 @@ class AnalyticsService:
         
         return processed_results
 
+def run(main: Coroutine) -> None:
+    """Run the service entrypoint coroutine on uvloop.
+    
+    Drop-in replacement for asyncio.run(); uvloop's event loop is 2-4x
+    faster for IO-heavy services like this one.
+    """
+    uvloop.run(main)
+
 # Database schema optimization (DDL for reference)
 """
--- Materialized view for pre-aggregated metrics
-CREATE MATERIALIZED VIEW mv_metrics_active_users AS
-SELECT 
-    date_trunc('hour', timestamp) as timestamp,
-    tenant_id,
-    COUNT(DISTINCT user_id) as value
-FROM events
-WHERE event_type = 'page_view'
-GROUP BY date_trunc('hour', timestamp), tenant_id;
+-- Refresh bookkeeping: one row per view, keyed by view name. Each view's
+-- refresh job updates only its own row, so a live tail always starts at
+-- that view's own last refresh. Views without a row report unknown
+-- freshness and never get a live tail.
+CREATE TABLE mv_metadata (
+    view_name text PRIMARY KEY,
+    last_refresh timestamptz NOT NULL
+);
 
--- Index for fast range queries
-CREATE INDEX idx_mv_metrics_timestamp 
-ON mv_metrics_active_users(timestamp);
+-- HyperLogLog sketches (~1% error) instead of COUNT(DISTINCT): no sort,
+-- parallel-aggregation friendly, and sketches merge associatively
+CREATE EXTENSION IF NOT EXISTS hll;
+
+-- Incrementally maintained rollup: a plain table (not a materialized
+-- view) so the refresh job can UPSERT deltas. Name kept so queries are
+-- unchanged.
+-- users_hll: per-hour distinct-user sketch, unioned at query time
+-- value: that hour's estimated distinct users
+CREATE TABLE mv_metrics_active_users (
+    timestamp timestamptz NOT NULL,
+    tenant_id bigint NOT NULL,
+    users_hll hll NOT NULL,
+    value bigint NOT NULL,
+    PRIMARY KEY (timestamp, tenant_id)  -- Also serves range queries
+);
 
+-- Index for tenant-scoped range queries
 CREATE INDEX idx_mv_metrics_tenant 
 ON mv_metrics_active_users(tenant_id, timestamp);
 
--- Refresh materialized view every 5 minutes
+-- Change log of new page views since the last refresh
+CREATE TABLE mv_metrics_active_users_mlog (
+    event_ts timestamptz NOT NULL,
+    tenant_id bigint NOT NULL,
+    user_id bigint NOT NULL
+);
+
+-- Statement-level trigger: one log insert per batch of events, not per row.
+-- Only INSERTs are logged: events is append-only, and HLL sketches can't
+-- subtract users, so UPDATE/DELETE on events need a rebuild of the
+-- affected hours instead.
+CREATE FUNCTION log_active_user_events() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO mv_metrics_active_users_mlog (event_ts, tenant_id, user_id)
+    SELECT timestamp, tenant_id, user_id
+    FROM new_events
+    WHERE event_type = 'page_view';
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_events_active_users_mlog
+AFTER INSERT ON events
+REFERENCING NEW TABLE AS new_events
+FOR EACH STATEMENT
+EXECUTE FUNCTION log_active_user_events();
+
+-- Fold logged deltas into the rollup. Consuming the log with
+-- DELETE ... RETURNING means no processed flag and no compaction job.
+-- Sketches merge with hll_union, so re-counting users already seen in
+-- that hour never inflates the distinct count.
+CREATE FUNCTION refresh_mv_metrics_active_users() RETURNS void AS $$
+    WITH delta AS (
+        DELETE FROM mv_metrics_active_users_mlog
+        RETURNING event_ts, tenant_id, user_id
+    )
+    INSERT INTO mv_metrics_active_users AS mv
+        (timestamp, tenant_id, users_hll, value)
+    SELECT
+        date_trunc('hour', event_ts),
+        tenant_id,
+        hll_add_agg(hll_hash_text(user_id::text)),
+        hll_cardinality(hll_add_agg(hll_hash_text(user_id::text)))
+    FROM delta
+    GROUP BY date_trunc('hour', event_ts), tenant_id
+    ON CONFLICT (timestamp, tenant_id) DO UPDATE SET
+        users_hll = hll_union(mv.users_hll, EXCLUDED.users_hll),
+        value = hll_cardinality(hll_union(mv.users_hll, EXCLUDED.users_hll));
+    
+    UPDATE mv_metadata SET last_refresh = now()
+    WHERE view_name = 'mv_metrics_active_users';
+$$ LANGUAGE sql;
+
+-- One-time seed from existing history, run after the trigger exists.
+-- Events logged while this runs are also seen here; the hll_union merge
+-- makes that overlap harmless (a user is never counted twice in an hour).
+INSERT INTO mv_metrics_active_users AS mv
+    (timestamp, tenant_id, users_hll, value)
+SELECT
+    date_trunc('hour', timestamp),
+    tenant_id,
+    hll_add_agg(hll_hash_text(user_id::text)),
+    hll_cardinality(hll_add_agg(hll_hash_text(user_id::text)))
+FROM events
+WHERE event_type = 'page_view'
+GROUP BY date_trunc('hour', timestamp), tenant_id
+ON CONFLICT (timestamp, tenant_id) DO UPDATE SET
+    users_hll = hll_union(mv.users_hll, EXCLUDED.users_hll),
+    value = hll_cardinality(hll_union(mv.users_hll, EXCLUDED.users_hll));
+
+INSERT INTO mv_metadata (view_name, last_refresh)
+VALUES ('mv_metrics_active_users', now());
+
+-- Apply deltas every minute (seconds of work instead of a full rebuild)
 -- (Use pg_cron or similar)
 CREATE EXTENSION IF NOT EXISTS pg_cron;
 
 SELECT cron.schedule(
     'refresh-metrics',
-    '*/5 * * * *',
-    $$REFRESH MATERIALIZED VIEW CONCURRENTLY mv_metrics_active_users$$
+    '* * * * *',
+    $$SELECT refresh_mv_metrics_active_users()$$
 );
 """
 ```
@@ -404,24 +1173,34 @@ SELECT cron.schedule(
 The performance analysis caught these optimizations before code generation:
 
 1. **Multi-Tier Caching Strategy**
-   - Hot data (24h): Always cached, 5min TTL
-   - Warm data (1-7d): Cache on access, 10min TTL
+   - In-process L0 (30s TTL) in front of Redis for ultra-hot keys
+   - Hot data (24h): Always cached, 5min TTL (+/-10% jitter)
+   - Warm data (1-7d): Cache on access, 10min TTL (+/-10% jitter)
    - Cold data (7-30d): Direct DB query (low traffic)
-   - Prevents cache stampede on popular metrics
+   - Prevents cache stampede on popular metrics (single-flight per key,
+     Redis recompute lock across workers, XFetch early refresh)
+   - Versioned msgpack payloads (smaller, faster to decode than JSON)
+   - zstd compression for payloads over 1KB (less Redis RAM and network)
 
 2. **Database Optimization**
    - Materialized views instead of live aggregation
    - Indexed on timestamp for fast range queries
    - Pre-aggregated hourly/daily/weekly data
+   - HyperLogLog sketches for distinct users (no COUNT(DISTINCT) sort)
+   - Incremental refresh from a change log instead of full rebuilds
+   - Live tail from base events when a view is 2-60min stale
    - O(log n) query time vs O(n) full scan
 
 3. **Concurrency Control**
-   - Semaphore limits concurrent DB queries
+   - Permit pool (sized to the DB pool) limits concurrent DB queries
+   - Per-metric permit shares (no head-of-line blocking across metrics)
+   - Sheds load (503) when no permit frees up within 200ms
    - Prevents database connection exhaustion
-   - Handles 5000 qps with connection pooling
+   - Handles 5000 qps with connection pooling (pre-warmed asyncpg pool)
    - Graceful degradation under load
 
 4. **Batch Operations**
+   - Single Redis MGET for all cached dashboard metrics
    - Dashboard loads all metrics in parallel
    - Reduces total latency (not sequential)
    - Handles partial failures gracefully
@@ -430,7 +1209,7 @@ The performance analysis caught these optimizations before code generation:
 5. **Monitoring & Observability**
    - Query time logging for all requests
    - Cache hit/miss tracking
-   - Data freshness timestamp
+   - Data freshness timestamp (cached 10s in-process)
    - Performance metrics for tuning
 
 ## Performance Verification Checklist
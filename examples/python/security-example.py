@@ -52,12 +52,14 @@ Then implement with appropriate security controls in place.
 ```python
 from datetime import datetime, timedelta
 from typing import Optional
+import asyncio
 import secrets
 import hmac
 import hashlib
 from dataclasses import dataclass
 from enum import Enum
 
+import bcrypt
 from pydantic import BaseModel, EmailStr, constr
 from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -214,7 +216,6 @@ async def request_password_reset(
     else:
         # User doesn't exist - same response time as success case
         # This prevents timing-based email enumeration
-        import asyncio
         await asyncio.sleep(0.1)  # Simulate DB + email time
     
     # Always return same generic success message
@@ -287,7 +288,6 @@ async def submit_password_reset(
         )
     
     # Hash new password (use bcrypt/argon2 in production)
-    import bcrypt
     password_hash = bcrypt.hashpw(
         new_password.encode(),
         bcrypt.gensalt(rounds=12)